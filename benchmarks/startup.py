@@ -0,0 +1,53 @@
+"""Measure the time from `python index.py` to a green /readyz.
+
+Needs the same environment as the bot (.env with TELEGRAM_BOT_TOKEN, ffmpeg in
+PATH). Exits with status 1 when startup takes longer than STARTUP_BUDGET.
+
+    python benchmarks/startup.py
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+budget = float(os.environ.get('STARTUP_BUDGET', 10))
+port = int(os.environ.get('HEALTH_PORT', 8080))
+
+
+def is_ready():
+    try:
+        with urllib.request.urlopen(f'http://localhost:{port}/readyz', timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError):
+        return False
+
+
+def main():
+    started = time.monotonic()
+    bot = subprocess.Popen([sys.executable, 'index.py'], cwd=root)
+    try:
+        # Keep polling a bit past the budget so the report shows how far off it is
+        while time.monotonic() - started < budget * 2:
+            if bot.poll() is not None:
+                print(f'index.py exited with status {bot.returncode} before it was ready')
+                return 1
+            if is_ready():
+                break
+            time.sleep(0.05)
+        else:
+            print(f'Not ready after {budget * 2:.2f}s (budget {budget:.2f}s)')
+            return 1
+
+        startup_time = time.monotonic() - started
+        print(f'Ready in {startup_time:.2f}s (budget {budget:.2f}s)')
+        return 0 if startup_time <= budget else 1
+    finally:
+        bot.terminate()
+        bot.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Download only the part of a DASH stream that covers a time window.
+
+YouTube serves its adaptive mp4 streams as fragmented mp4 files: an init
+segment (ftyp + moov) followed by a segment index (sidx) and the media
+fragments. Reading the sidx tells us which byte ranges hold which time range,
+so a clip can be fetched without downloading the whole stream.
+"""
+import re
+import struct
+
+# Matches "1:20-1:50", "80-110" or "1:02:03-1:02:33"
+_clip_pattern = re.compile(r'^(\d+(?::[0-5]?\d){0,2})-(\d+(?::[0-5]?\d){0,2})$')
+# Anything that looks like a time range, to reject "1:99-2:00" instead of ignoring it
+_range_pattern = re.compile(r'^[\d:]+-[\d:]+$')
+
+
+class ClipRangeError(ValueError):
+    """The requested window does not fit the video."""
+
+
+def parse_timestamp(value):
+    """Convert "[[h:]m:]s" to seconds."""
+    seconds = 0
+    for part in value.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def parse_clip(text):
+    """Split a message into the video url and an optional clip window.
+
+    :param str text:
+        Message text, e.g. "https://youtu.be/... 1:20-1:50".
+    :rtype: tuple
+    :returns:
+        The url and a (start, end) tuple in seconds, or None without a clip.
+    """
+    parts = text.split()
+    if len(parts) < 2:
+        return text.strip(), None
+
+    match = _clip_pattern.match(parts[-1])
+    if not match:
+        if _range_pattern.match(parts[-1]):
+            raise ClipRangeError(f"Invalid time range {parts[-1]}, use e.g. 1:20-1:50")
+        return text.strip(), None
+
+    start = parse_timestamp(match.group(1))
+    end = parse_timestamp(match.group(2))
+    if end <= start:
+        raise ClipRangeError("The end of the clip must be after its start")
+    return ' '.join(parts[:-1]), (start, end)
+
+
+def parse_sidx(data, offset):
+    """Parse a sidx box into a list of segments.
+
+    :param bytes data:
+        The bytes of the index range.
+    :param int offset:
+        Position of the index range in the stream.
+    :rtype: list
+    :returns:
+        (start_time, end_time, first_byte, last_byte) for every segment.
+    """
+    size, box_type = struct.unpack('>I4s', data[:8])
+    if box_type != b'sidx':
+        raise ValueError("Index range does not start with a sidx box")
+
+    version = data[8]
+    timescale, = struct.unpack('>I', data[16:20])
+    if version == 0:
+        earliest, first_offset = struct.unpack('>II', data[20:28])
+        pos = 28
+    else:
+        earliest, first_offset = struct.unpack('>QQ', data[20:36])
+        pos = 36
+    reference_count, = struct.unpack('>H', data[pos + 2:pos + 4])
+    pos += 4
+
+    segments = []
+    time = earliest
+    byte = offset + size + first_offset
+    for _ in range(reference_count):
+        reference, duration = struct.unpack('>II', data[pos:pos + 8])
+        referenced_size = reference & 0x7fffffff
+        segments.append((time / timescale, (time + duration) / timescale,
+                         byte, byte + referenced_size - 1))
+        time += duration
+        byte += referenced_size
+        pos += 12
+    return segments
+
+
+def get_index_ranges(yt):
+    """Map itags to the (initRange, indexRange) of the adaptive streams."""
+    ranges = {}
+    for fmt in yt.streaming_data.get('adaptiveFormats', []):
+        if 'initRange' in fmt and 'indexRange' in fmt:
+            ranges[fmt['itag']] = (fmt['initRange'], fmt['indexRange'])
+    return ranges
+
+
+def _fetch(url, first, last):
+    from pytube import request
+
+    # Same range parameter pytube uses for its chunked downloads
+    response = request._execute_request(f"{url}&range={first}-{last}", 'GET')
+    return response.read()
+
+
+def _download_range(stream, file_handler, first, last, bytes_remaining):
+    """Write bytes first..last to the file in chunks, like Stream.download().
+
+    Chunks are default_range_size big to avoid throttling, and go through
+    stream.on_progress so the registered progress callback is called.
+    """
+    from pytube import request
+
+    while first <= last:
+        stop = min(first + request.default_range_size, last + 1) - 1
+        chunk = _fetch(stream.url, first, stop)
+        bytes_remaining -= len(chunk)
+        stream.on_progress(chunk, file_handler, bytes_remaining)
+        first = stop + 1
+    return bytes_remaining
+
+
+def download_clip(stream, ranges, start, end, output_path):
+    """Download the init segment and the fragments covering [start, end].
+
+    :param stream:
+        The pytube Stream to download from.
+    :param tuple ranges:
+        The (initRange, indexRange) of the stream, see get_index_ranges().
+    :param float start:
+        Start of the clip in seconds.
+    :param float end:
+        End of the clip in seconds.
+    :param str output_path:
+        Where to write the fragmented mp4.
+    :rtype: float
+    :returns:
+        The time of the first downloaded fragment, so the caller can trim
+        relative to it.
+    """
+    init_range, index_range = ranges
+    index_start = int(index_range['start'])
+    index = _fetch(stream.url, index_start, int(index_range['end']))
+    segments = [segment for segment in parse_sidx(index, index_start)
+                if segment[1] > start and segment[0] < end]
+    if not segments:
+        raise ClipRangeError("The clip is outside of the video")
+
+    init_start, init_end = int(init_range['start']), int(init_range['end'])
+    # The fragments are contiguous, one range covers all of them
+    first, last = segments[0][2], segments[-1][3]
+    bytes_remaining = (init_end - init_start + 1) + (last - first + 1)
+    with open(output_path, 'wb') as f:
+        bytes_remaining = _download_range(stream, f, init_start, init_end, bytes_remaining)
+        _download_range(stream, f, first, last, bytes_remaining)
+    return segments[0][0]
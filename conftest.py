@@ -0,0 +1 @@
+# Lets the tests import the bot's top-level modules
@@ -0,0 +1,64 @@
+"""Liveness and readiness endpoints for the container orchestrator.
+
+GET /livez  -> 200 while the process is serving requests
+GET /readyz -> 200 once startup finished, 503 before that
+"""
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Set as early as possible, so the reported startup time covers the imports
+_started = time.monotonic()
+_ready_at = None
+_live_checks = []
+
+
+def set_ready():
+    """Mark startup as finished and return the startup time in seconds."""
+    global _ready_at
+    _ready_at = time.monotonic()
+    return _ready_at - _started
+
+
+def add_live_check(check):
+    """Register a callable that returns False once the process is unhealthy."""
+    _live_checks.append(check)
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/livez':
+            alive = all(check() for check in _live_checks)
+            self._reply(200 if alive else 503, {'alive': alive})
+        elif self.path == '/readyz':
+            ready = _ready_at is not None
+            body = {'ready': ready}
+            if ready:
+                body['startup_seconds'] = round(_ready_at - _started, 3)
+            self._reply(200 if ready else 503, body)
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Probes run every few seconds, keep them out of the bot log
+        pass
+
+
+def serve(port):
+    """Serve the health endpoints from a daemon thread."""
+    server = ThreadingHTTPServer(('0.0.0.0', port), _HealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Health endpoints listening on port {port}")
+    return server
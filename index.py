@@ -1,32 +1,45 @@
+import health
 import os
+import sys
+import shutil
 import subprocess
 import logging
-from dotenv import load_dotenv
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, CallbackQueryHandler,CallbackContext
 from telegram import Update,InlineKeyboardMarkup, InlineKeyboardButton
-from pytube import YouTube
 from threading import Thread
 import threading
 import asyncio
-import nest_asyncio
-nest_asyncio.apply()
 from queue import Queue
+from collections import OrderedDict
+from status_updater import StatusUpdater
+from clip import parse_clip, get_index_ranges, download_clip, ClipRangeError
+import subtitles
 
 upload_queue = Queue()
 
-# Load environment variables from .env
-load_dotenv()
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Access the variables
-telegram_bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+# Read from the environment in main(), after loading .env
+telegram_bot_token = None
+health_port = None
+# Seconds, exceeding it is logged as a warning
+startup_budget = None
 event = threading.Event()
 
+# Created on the bot's event loop in post_init
+status_updater = None
+
 
 # Dictionary to store user data
 user_data = {}
+
+# Exact file sizes that needed a HEAD request, keyed by (video_id, itag)
+filesize_cache = OrderedDict()
+filesize_cache_lock = threading.Lock()
+FILESIZE_CACHE_SIZE = 2048
+
 async def start(update: Update, context):
     await  update.message.reply_text("Hello! I'm your YouTube video downloader bot.")
 
@@ -36,9 +49,11 @@ async def download_video(update: Update, context):
     # Show a processing message while the request is being processed
     chat_id = update.effective_chat.id
 
-    video_url = update.message.text
-
     try:
+        # "URL 1:20-1:50" only downloads that part of the video
+        video_url, clip = parse_clip(update.message.text)
+        # Imported on first use, see prewarm()
+        from pytube import YouTube
         yt = YouTube(video_url)
 
         
@@ -51,40 +66,184 @@ async def download_video(update: Update, context):
         audio_streams = yt.streams.filter(only_audio=True,file_extension="mp4").all()
         target_audio = [stream for stream in audio_streams if  stream.abr == "128kbps"  ]
         exact_formats =  test + target_audio
-    
-        available_formats = [
-            [InlineKeyboardButton(f"{stream.resolution if  stream.resolution  else stream.abr} - { stream.mime_type.split('/')[1]  if stream.resolution else 'mp3' } - {format_size(stream.filesize)}",
-                                  callback_data=str(i))]
-            for i, stream in enumerate(exact_formats, start=1)
-        ]
-        
+
+        if clip and yt.length and clip[0] >= yt.length:
+            raise ClipRangeError(f"The clip starts after the end of the video ({yt.length}s)")
+
+        # A clip is roughly its share of the full size
+        size_ratio = min((clip[1] - clip[0]) / yt.length, 1) if clip and yt.length else 1
+
+        # Only use sizes known without a request, the rest are estimated for now
+        sizes = [cached_filesize(yt.video_id, stream) for stream in exact_formats]
+
+        # An unused keyboard of the previous link won't be edited anymore
+        previous = user_data.get(chat_id)
+        if previous and not previous.get('selected'):
+            status_updater.forget(chat_id, previous['message_id'])
 
         # Store available formats in user_data
-        user_data[chat_id] = {'formats': exact_formats, 'audio': target_audio}
+        user_data[chat_id] = {'formats': exact_formats, 'audio': target_audio, 'clip': clip,
+                              'index_ranges': get_index_ranges(yt) if clip else {},
+                              'message_id': process_message.message_id,
+                              'yt': yt, 'sizes': sizes, 'size_ratio': size_ratio,
+                              # Caption tracks come with the player response, no extra request
+                              'subtitles': bool(yt.caption_tracks), 'embed_subtitles': False,
+                              'language': update.effective_user.language_code}
 
         # Create an inline keyboard with clickable buttons for each format
-        reply_markup = InlineKeyboardMarkup(available_formats )
+        reply_markup = render_keyboard(user_data[chat_id])
 
+        # Sent directly, the status updater's spacing would only delay the first keyboard
+        await context.bot.edit_message_text(chat_id=chat_id, text="Select a format:",message_id=process_message.message_id, reply_markup=reply_markup)
 
-        message=   await context.bot.edit_message_text(chat_id=chat_id, text="Select a format:",message_id=process_message.message_id, reply_markup=reply_markup)
-
-        # Store the message ID for later deletion
-        user_data[chat_id]['message_id'] = message.message_id
+        # Only the in-place refresh with the exact sizes goes through the status updater
+        if None in sizes:
+            context.application.create_task(
+                resolve_keyboard_sizes(chat_id, yt.video_id, exact_formats))
 
     except Exception as e:
            await update.message.reply_text(text=f'Error: {str(e)}')
            logger.error(f"Error processing video download: {str(e)}")
 
 
+def manifest_filesize(stream):
+    # pytube keeps the manifest's contentLength in the private _filesize (0 when
+    # missing), the public Stream.filesize would issue a HEAD request instead
+    return getattr(stream, '_filesize', 0) or None
+
+
+def cached_filesize(video_id, stream):
+    # Size from the manifest or an earlier HEAD request, None if unknown
+    size = manifest_filesize(stream)
+    if size:
+        return size
+    key = (video_id, stream.itag)
+    with filesize_cache_lock:
+        if key in filesize_cache:
+            filesize_cache.move_to_end(key)
+            return filesize_cache[key]
+    return None
+
+
+def resolve_filesize(video_id, stream):
+    # stream.filesize issues a HEAD request when contentLength is missing
+    try:
+        size = stream.filesize
+    except Exception as e:
+        logger.error(f"Error resolving file size: {str(e)}")
+        return None
+    with filesize_cache_lock:
+        filesize_cache[(video_id, stream.itag)] = size
+        if len(filesize_cache) > FILESIZE_CACHE_SIZE:
+            filesize_cache.popitem(last=False)
+    return size
+
+
+def format_keyboard(formats, sizes, length, size_ratio=1, embed_subtitles=None):
+    buttons = []
+    for i, (stream, size) in enumerate(zip(formats, sizes), start=1):
+        estimated = size is None or size_ratio < 1
+        # Without bitrate or duration filesize_approx falls back to a HEAD request
+        if size is None and stream.bitrate and length:
+            # bitrate x duration, good enough until the exact size arrives
+            size = stream.filesize_approx
+        size_text = f"{'~' if estimated else ''}{format_size(size * size_ratio)}" if size else '?'
+        buttons.append([InlineKeyboardButton(
+            f"{stream.resolution if  stream.resolution  else stream.abr} - { stream.mime_type.split('/')[1]  if stream.resolution else 'mp3' } - {size_text}",
+            callback_data=str(i))])
+
+    # None when the video has no captions
+    if embed_subtitles is not None:
+        buttons.append([InlineKeyboardButton("Subtitles - srt", callback_data='srt'),
+                        InlineKeyboardButton("Subtitles - vtt", callback_data='vtt')])
+        buttons.append([InlineKeyboardButton(f"Embed subtitles in video: {'on' if embed_subtitles else 'off'}",
+                                             callback_data='embed')])
+    return InlineKeyboardMarkup(buttons)
+
+
+def render_keyboard(data):
+    return format_keyboard(data['formats'], data['sizes'], data['yt'].length, data['size_ratio'],
+                           data['embed_subtitles'] if data['subtitles'] else None)
+
+
+async def resolve_keyboard_sizes(chat_id, video_id, formats):
+    # Resolve the missing sizes concurrently and update the keyboard in place as
+    # each one arrives, the status updater coalesces the edits
+    async def resolve(i):
+        return i, await asyncio.to_thread(resolve_filesize, video_id, formats[i])
+
+    missing = [i for i, stream in enumerate(formats) if cached_filesize(video_id, stream) is None]
+    for next_size in asyncio.as_completed([resolve(i) for i in missing]):
+        i, size = await next_size
+        if size is None:
+            continue
+
+        data = user_data.get(chat_id, {})
+        # Don't bring the keyboard back once a format was picked or a new link was sent
+        if data.get('formats') is not formats or data.get('selected'):
+            return
+        data['sizes'][i] = size
+        status_updater.edit(chat_id, data['message_id'], "Select a format:", render_keyboard(data))
+
+
+async def send_subtitles(update, context, subtitle_format):
+    query = update.callback_query
+    chat_id = query.message.chat_id
+    data = user_data[chat_id]
+    yt = data['yt']
+
+    # Other jobs in the chat keep their own chat actions
+    job = ('subtitles', query.id)
+    status_updater.start_chat_action(chat_id, 'upload_document', job)
+    try:
+        # Cached per video and language, only the first request hits YouTube
+        cues = await asyncio.to_thread(subtitles.get_cues, yt, data['language'])
+        if data['clip']:
+            cues = subtitles.clip_cues(cues, *data['clip'])
+        if not cues:
+            await context.bot.send_message(chat_id=chat_id, text="No subtitles available for this video.")
+            return
+
+        text = subtitles.to_srt(cues) if subtitle_format == 'srt' else subtitles.to_vtt(cues)
+        title = yt.title.replace("|", "_")
+        await context.bot.send_document(chat_id=chat_id, document=text.encode(),
+                                        filename=f"{title}.{subtitle_format}")
+    except Exception as e:
+        await context.bot.send_message(chat_id=chat_id, text=f'Error: Please try again ' + str(e))
+        logger.error(f"Error sending subtitles: {str(e)}")
+    finally:
+        status_updater.stop_chat_action(chat_id, job)
+
+
 async def button_click(update: Update, context):
     query = update.callback_query
     chat_id = query.message.chat_id
+
+    # Buttons of an older keyboard would act on the formats of the latest link
+    data = user_data.get(chat_id)
+    if data is None or data['message_id'] != query.message.message_id or data.get('selected'):
+        await query.answer("This list is outdated, please send the link again.")
+        return
+
+    # Subtitle buttons keep the keyboard, a format can still be picked afterwards
+    if query.data in ('srt', 'vtt'):
+        await query.answer()
+        await send_subtitles(update, context, query.data)
+        return
+    if query.data == 'embed':
+        await query.answer()
+        data['embed_subtitles'] = not data['embed_subtitles']
+        status_updater.edit(chat_id, data['message_id'], "Select a format:", render_keyboard(data))
+        return
+
     selected_format_index = int(query.data)
+    user_data[chat_id]['selected'] = True
     # Remove the buttons
     
 
     # Display a progress bar while downloading the video
-    progress_message =  await context.bot.edit_message_text(chat_id=chat_id, text="Downloading...", message_id=user_data[chat_id]['message_id'])
+    progress_message_id = user_data[chat_id]['message_id']
+    status_updater.edit(chat_id, progress_message_id, "Downloading...")
 
     # Retrieve the selected format from user_data
     formats = user_data.get(chat_id, {}).get('formats')
@@ -94,6 +253,14 @@ async def button_click(update: Update, context):
 
     audio_format = user_data.get(chat_id, {}).get('audio')[0]
 
+    clip = user_data.get(chat_id, {}).get('clip')
+    index_ranges = user_data.get(chat_id, {}).get('index_ranges')
+
+    # Captions to soft-mux into the video, fetched by the download thread
+    subtitle_source = None
+    if user_data[chat_id].get('embed_subtitles') and selected_video_format.resolution:
+        subtitle_source = (user_data[chat_id]['yt'], user_data[chat_id]['language'])
+
     # Create a separate thread to download the video
     event_loop = asyncio.get_event_loop()
     print(event_loop)
@@ -103,13 +270,13 @@ async def button_click(update: Update, context):
 
 # Do something with the event loop
     print("Current event button click:", loop_id )
-    await context.bot.send_chat_action(chat_id=chat_id, action='typing')
-    download_thread = Thread(target= download_thread_wrapper, args=(update, context, selected_video_format,audio_format, progress_message,event_loop))
+    status_updater.start_chat_action(chat_id, 'typing', progress_message_id)
+    download_thread = Thread(target= download_thread_wrapper, args=(update, context, selected_video_format,audio_format, progress_message_id,event_loop,clip,index_ranges,subtitle_source,user_data[chat_id]['yt']))
     # upload_thread = Thread(target=upload_worker, args=(upload_queue,))
     download_thread.start()
 
 
-def download_thread_wrapper(update, context, selected_format,audio_format, progress_message,event_loop):
+def download_thread_wrapper(update, context, selected_format,audio_format, progress_message_id,event_loop,clip=None,index_ranges=None,subtitle_source=None,yt=None):
 
 
 # Do something with the event loop
@@ -117,42 +284,91 @@ def download_thread_wrapper(update, context, selected_format,audio_format, progr
 
     # asyncio.set_event_loop(event_loop)
 
-    title = selected_format.title.replace("|", "_")
-
-
-    # Simulate downloading action
-    if(selected_format.abr == "128kbps"):
-        audio_path = selected_format.download(filename=f"{title}+.mp4")
-        output_path = convert_mp4_to_mp3(audio_path,f"{title}_audio_.mp3")
-        os.remove(audio_path)
-    else:
-        video_path = selected_format.download(filename=f"{title}_video.mp4")
-        audio_path = audio_format.download(filename=f"{title}_audio.mp4")
-        output_path = merge_video_audio(video_path,audio_path, f"{title}_output.mp4")
-        os.remove(video_path)
-        os.remove(audio_path)
+    chat_id = update.effective_chat.id
+    try:
+        title = selected_format.title.replace("|", "_")
+
+        # Report download progress, the status updater coalesces the edits.
+        # The first call tells the total, which for clips is not the filesize.
+        totals = {}
+        def on_progress(stream, chunk, bytes_remaining):
+            label = stream.resolution if stream.resolution else stream.abr
+            total = totals.setdefault(stream.itag, bytes_remaining + len(chunk))
+            percent = (total - bytes_remaining) * 100 // total
+            status_updater.edit(chat_id, progress_message_id, f"Downloading {label}... {percent}%")
+
+        yt.register_on_progress_callback(on_progress)
+
+        subtitle_path = None
+        if subtitle_source:
+            cues = subtitles.get_cues(*subtitle_source)
+            if clip:
+                cues = subtitles.clip_cues(cues, *clip)
+            if cues:
+                subtitle_path = f"{title}_subtitles.srt"
+                with open(subtitle_path, 'w', encoding='utf-8') as f:
+                    f.write(subtitles.to_srt(cues))
+
+
+        # Simulate downloading action
+        if clip:
+            start, end = clip
+            duration = end - start
+            status_updater.edit(chat_id, progress_message_id, "Downloading clip...")
+            if(selected_format.abr == "128kbps"):
+                audio_path, audio_offset = download_stream_clip(selected_format, index_ranges, clip, f"{title}+.mp4", totals)
+                status_updater.edit(chat_id, progress_message_id, "Converting...")
+                output_path = convert_mp4_to_mp3(audio_path,f"{title}_audio_.mp3", audio_offset, duration)
+                os.remove(audio_path)
+            else:
+                video_path, video_offset = download_stream_clip(selected_format, index_ranges, clip, f"{title}_video.mp4", totals)
+                audio_path, audio_offset = download_stream_clip(audio_format, index_ranges, clip, f"{title}_audio.mp4", totals)
+                status_updater.edit(chat_id, progress_message_id, "Merging...")
+                output_path = merge_video_audio(video_path,audio_path, f"{title}_output.mp4",
+                                                video_offset, audio_offset, duration, subtitle_path)
+                os.remove(video_path)
+                os.remove(audio_path)
+        elif(selected_format.abr == "128kbps"):
+            audio_path = selected_format.download(filename=f"{title}+.mp4")
+            status_updater.edit(chat_id, progress_message_id, "Converting...")
+            output_path = convert_mp4_to_mp3(audio_path,f"{title}_audio_.mp3")
+            os.remove(audio_path)
+        else:
+            video_path = selected_format.download(filename=f"{title}_video.mp4")
+            audio_path = audio_format.download(filename=f"{title}_audio.mp4")
+            status_updater.edit(chat_id, progress_message_id, "Merging...")
+            output_path = merge_video_audio(video_path,audio_path, f"{title}_output.mp4", subtitle_file=subtitle_path)
+            os.remove(video_path)
+            os.remove(audio_path)
+        if subtitle_path:
+            os.remove(subtitle_path)
+    except Exception as e:
+        logger.error(f"Error downloading video: {str(e)}")
+        status_updater.edit(chat_id, progress_message_id, f'Error: Please try again ' + str(e))
+        status_updater.forget(chat_id, progress_message_id)
+        return
+    finally:
+        # The upload sets its own chat action, don't keep "typing" alive on errors
+        status_updater.stop_chat_action(chat_id, progress_message_id)
     # Download the selected video format
 
   
   
-    event_loop.run_until_complete(download_and_send(update,context,output_path,progress_message))
+    event_loop.run_until_complete(download_and_send(update,context,output_path,progress_message_id))
 
 
-async def download_and_send(update, context ,output_path, progress_message):
+async def download_and_send(update, context ,output_path, progress_message_id):
     try:
         chat_id = update.effective_chat.id
 
 # Do something with the event loop
 
-        # Simulate converting action
-        await context.bot.send_chat_action(chat_id=chat_id, action='typing')
+        # Uploading action, refreshed by the status updater until the upload is done
+        status_updater.start_chat_action(chat_id, 'upload_document', progress_message_id)
 
-        # Simulate uploading action
-        await context.bot.send_chat_action(chat_id=chat_id, action='upload_video')
+        status_updater.edit(chat_id, progress_message_id, "Uploading...")
 
-        await context.bot.edit_message_text(chat_id=chat_id, text=f"Uploading...", message_id=progress_message.message_id)
-
-        upload_queue.put((chat_id, output_path,context))
+        upload_queue.put((chat_id, output_path,context,progress_message_id))
         await upload_worker(upload_queue)
 
         
@@ -168,22 +384,62 @@ async def download_and_send(update, context ,output_path, progress_message):
 
 
         # Remove the progress message
-        # await context.bot.delete_message(chat_id=chat_id, message_id=progress_message.message_id)
+        # await context.bot.delete_message(chat_id=chat_id, message_id=progress_message_id)
 
     except Exception as e:
         # Log the error with traceback
         # Send the error message to the user
+        status_updater.stop_chat_action(chat_id, progress_message_id)
+        status_updater.forget(chat_id, progress_message_id)
         await context.bot.send_message(chat_id=chat_id, text=f'Error: Please try again ' + str(e))
 
 
 
-def merge_video_audio(input_video, input_audio, output_file):
+def download_stream_clip(stream, index_ranges, clip, filename, progress_totals=None):
+    # Returns the downloaded file and where the clip starts in it.
+    # progress_totals is the per-itag total the progress callback computes.
+    start, end = clip
+    ranges = index_ranges.get(stream.itag)
+    if ranges is not None:
+        try:
+            first_segment = download_clip(stream, ranges, start, end, filename)
+            return filename, start - first_segment
+        except ClipRangeError:
+            # A full download can't help with a window outside the video
+            raise
+        except Exception as e:
+            logger.error(f"Error downloading clip byte ranges, falling back to full download: {str(e)}")
+            # The full download has a different total than the clip
+            if progress_totals is not None:
+                progress_totals.pop(stream.itag, None)
+    return stream.download(filename=filename), start
+
+
+def trim_args(offset=None, duration=None):
+    # Input seeking, with stream copy the cut snaps to the previous keyframe
+    args = []
+    if offset is not None:
+        args += ['-ss', f"{offset:.3f}"]
+    if duration is not None:
+        args += ['-t', f"{duration:.3f}"]
+    return args
+
+
+def merge_video_audio(input_video, input_audio, output_file, video_offset=None, audio_offset=None, duration=None, subtitle_file=None):
+
+    # Soft subtitles: the srt is muxed as a mov_text track, video stays a copy
+    subtitle_args = []
+    if subtitle_file:
+        subtitle_args = ['-i', subtitle_file, '-map', '0:v', '-map', '1:a', '-map', '2:s', '-c:s', 'mov_text']
 
     command = [
         'ffmpeg',
         '-y',
+        *trim_args(video_offset, duration),
         '-i', input_video,
+        *trim_args(audio_offset, duration),
         '-i', input_audio,
+        *subtitle_args,
         '-c:v', 'copy',
         '-c:a', 'aac',
         '-strict', 'experimental',
@@ -198,10 +454,10 @@ def merge_video_audio(input_video, input_audio, output_file):
     except subprocess.CalledProcessError as e:
         print(f'Error during merging: {e}')
 
-def convert_mp4_to_mp3(input_file, output_file):
+def convert_mp4_to_mp3(input_file, output_file, offset=None, duration=None):
     try:
         # Run ffmpeg command
-        subprocess.run(['ffmpeg','-y','-i', input_file, '-vn', '-acodec', 'libmp3lame', output_file])
+        subprocess.run(['ffmpeg','-y',*trim_args(offset, duration),'-i', input_file, '-vn', '-acodec', 'libmp3lame', output_file])
 
         print(f"Conversion successful: {output_file}")
         return output_file
@@ -221,16 +477,69 @@ def format_size(size):
 async def upload_worker(upload_queue):
     print("running")
     while True:
-        chat_id, output_path,context =  upload_queue.get()
+        chat_id, output_path,context,progress_message_id =  upload_queue.get()
         with open(output_path
                   , 'rb') as document_file:
              asyncio.run(context.bot.send_document(chat_id=chat_id, document=document_file))
         os.remove(output_path)
+        status_updater.stop_chat_action(chat_id, progress_message_id)
+        status_updater.forget(chat_id, progress_message_id)
         upload_queue.task_done()
 
+async def post_init(app):
+    global status_updater
+    loop = asyncio.get_running_loop()
+    status_updater = StatusUpdater(app.bot, loop)
+    # Keep a reference so the task is not garbage collected
+    app.bot_data['status_task'] = loop.create_task(status_updater.run())
+    health.add_live_check(lambda: not app.bot_data['status_task'].done())
+
+    # The bot's connection pool is already warm from initialize(), warm the download path too
+    await asyncio.to_thread(prewarm)
+
+    app.bot_data['ready_task'] = loop.create_task(mark_ready(app))
+
+async def mark_ready(app):
+    # post_init runs before polling starts, only report ready once updates come in
+    while not (app.running and app.updater.running):
+        await asyncio.sleep(0.05)
+
+    startup_time = health.set_ready()
+    logger.info(f"Ready in {startup_time:.2f}s")
+    if startup_time > startup_budget:
+        logger.warning(f"Startup took {startup_time:.2f}s, over the budget of {startup_budget:.2f}s")
+
+def prewarm():
+    # Import pytube off the event loop so the first link doesn't pay for it
+    import pytube
+    import pytube.request
+    logger.info(f"Loaded pytube {pytube.__version__}")
+
+def check_config():
+    # Fail fast instead of on the first download
+    if not telegram_bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN is not set")
+        sys.exit(1)
+    if shutil.which('ffmpeg') is None:
+        logger.error("ffmpeg was not found in PATH")
+        sys.exit(1)
+
 def main():
+    global telegram_bot_token, health_port, startup_budget
+    from dotenv import load_dotenv
+    import nest_asyncio
+
+    # Load environment variables from .env
+    load_dotenv()
+    telegram_bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
+    health_port = int(os.environ.get('HEALTH_PORT', 8080))
+    startup_budget = float(os.environ.get('STARTUP_BUDGET', 10))
+    check_config()
+
+    health.serve(health_port)
+    nest_asyncio.apply()
 
-    app = ApplicationBuilder().token(telegram_bot_token).build()
+    app = ApplicationBuilder().token(telegram_bot_token).post_init(post_init).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, download_video))
     app.add_handler(CallbackQueryHandler(button_click))
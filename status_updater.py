@@ -0,0 +1,268 @@
+"""Throttled, coalescing status updates for Telegram messages.
+
+Every job reports its state through a single StatusUpdater instead of calling
+edit_message_text / send_chat_action directly. Edits to the same message are
+coalesced (only the latest text is sent), identical edits are skipped and all
+calls are spaced out to stay under Telegram's flood limits.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 requests per second overall, one message per
+# second in a private chat and 20 messages per minute in a group.
+GLOBAL_RATE = 30
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+
+# Chat actions expire after 5 seconds on the client, refresh slightly earlier.
+CHAT_ACTION_INTERVAL = 4.5
+
+# Requests are sent concurrently, the rate limits above are the real throttle
+MAX_IN_FLIGHT = 30
+
+
+class StatusUpdater:
+    """Central queue for message edits and chat actions.
+
+    The public methods are plain functions guarded by a lock, so they can be
+    called from the event loop as well as from the download threads (e.g. a
+    pytube progress callback). The actual requests are sent by run(), which
+    must be scheduled on the bot's event loop.
+
+    Ready edits and chat actions are served oldest first, with at most one
+    request in flight per chat so edits of a message arrive in order.
+    """
+    def __init__(self, bot, loop, clock=time.monotonic):
+        """Initialize a StatusUpdater.
+
+        :param bot:
+            The telegram Bot used to send the requests.
+        :param loop:
+            The event loop run() is scheduled on.
+        :param clock:
+            Monotonic time source, replaced in tests.
+        """
+        self.bot = bot
+        self.loop = loop
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+
+        # (chat_id, message_id) -> [text, reply_markup, queued at], latest text wins
+        self._pending = OrderedDict()
+        # (chat_id, message_id) -> last text that reached Telegram
+        self._sent = {}
+        # messages whose state is dropped once their queued edits are sent
+        self._finished = set()
+        # chat_id -> {job: action}, the most recently started action is shown
+        self._actions = {}
+        # chat_id -> next time the chat action is due
+        self._action_due = {}
+        # chat_id -> earliest time the next request for that chat may be sent
+        self._chat_ready = {}
+        # chats with a request on its way
+        self._in_flight = set()
+        # send times of the requests in the last second
+        self._recent = deque()
+        self._paused_until = 0.0
+        self._tasks = set()
+
+    def edit(self, chat_id, message_id, text, reply_markup=None):
+        """Queue an edit of a message, replacing any edit not yet sent."""
+        key = (chat_id, message_id)
+        with self._lock:
+            if reply_markup is None and self._sent.get(key) == text:
+                self._pending.pop(key, None)
+                return
+            if key in self._pending:
+                # Keep the place in the queue, only the content changes
+                self._pending[key][:2] = [text, reply_markup]
+            else:
+                self._pending[key] = [text, reply_markup, self.clock()]
+        self._notify()
+
+    def forget(self, chat_id, message_id):
+        """Drop the state kept for a message once its queued edits are sent.
+
+        Call this when a job finishes or fails, a final edit queued right
+        before is still delivered.
+        """
+        key = (chat_id, message_id)
+        with self._lock:
+            self._sent.pop(key, None)
+            if key in self._pending:
+                self._finished.add(key)
+
+    def start_chat_action(self, chat_id, action, job=None):
+        """Show a chat action and keep it alive until stop_chat_action().
+
+        :param job:
+            Identifies the job showing the action, several jobs can run in
+            the same chat and each one stops only its own action.
+        """
+        with self._lock:
+            actions = self._actions.setdefault(chat_id, {})
+            if actions.get(job) == action and list(actions)[-1] == job:
+                return
+            actions.pop(job, None)
+            actions[job] = action
+            self._action_due[chat_id] = 0.0
+        self._notify()
+
+    def stop_chat_action(self, chat_id, job=None):
+        """Stop refreshing the chat action a job started."""
+        with self._lock:
+            actions = self._actions.get(chat_id)
+            if actions is None:
+                return
+            actions.pop(job, None)
+            if not actions:
+                del self._actions[chat_id]
+                del self._action_due[chat_id]
+
+    def _notify(self):
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _chat_interval(self, chat_id):
+        return GROUP_CHAT_INTERVAL if chat_id < 0 else PRIVATE_CHAT_INTERVAL
+
+    def _global_delay(self, now):
+        """Seconds to wait before the next request may be sent at all."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= GLOBAL_RATE:
+            return self._recent[0] + 1.0 - now
+        return 0.0
+
+    def _next_job(self, now):
+        """Pick the ready request that has been due the longest.
+
+        :rtype: tuple
+        :returns:
+            The job to send (or None) and the seconds until the next job
+            becomes ready (or None if there is nothing to wait for).
+        """
+        # Entries in the past don't delay anything, don't keep them around
+        for chat_id in [chat_id for chat_id, ready in self._chat_ready.items() if ready <= now]:
+            del self._chat_ready[chat_id]
+
+        best = None
+        best_due = None
+        delay = None
+        with self._lock:
+            candidates = [(key[0], due, ('edit', key)) for key, (_, _, due) in self._pending.items()]
+            candidates += [(chat_id, due, ('action', chat_id)) for chat_id, due in self._action_due.items()]
+            for chat_id, due, job in candidates:
+                if chat_id in self._in_flight:
+                    # Woken up again when the request in flight is done
+                    continue
+                ready = max(due, self._chat_ready.get(chat_id, 0.0))
+                if ready > now:
+                    delay = ready - now if delay is None else min(delay, ready - now)
+                elif best_due is None or due < best_due:
+                    best, best_due = job, due
+
+            if best is None:
+                return None, delay
+            if best[0] == 'edit':
+                text, reply_markup, _ = self._pending.pop(best[1])
+                return ('edit', best[1], text, reply_markup), 0.0
+            chat_id = best[1]
+            self._action_due[chat_id] = now + CHAT_ACTION_INTERVAL
+            action = list(self._actions[chat_id].values())[-1]
+            return ('action', chat_id, action), 0.0
+
+    async def _send(self, job):
+        if job[0] == 'edit':
+            _, (chat_id, message_id), text, reply_markup = job
+            await self.bot.edit_message_text(chat_id=chat_id, message_id=message_id,
+                                             text=text, reply_markup=reply_markup)
+            with self._lock:
+                if (chat_id, message_id) not in self._finished:
+                    self._sent[(chat_id, message_id)] = text
+        else:
+            _, chat_id, action = job
+            await self.bot.send_chat_action(chat_id=chat_id, action=action)
+
+    def _requeue(self, job):
+        with self._lock:
+            if job[0] == 'edit':
+                _, key, text, reply_markup = job
+                # A newer edit queued in the meantime wins over the failed one
+                if key not in self._pending:
+                    self._pending[key] = [text, reply_markup, 0.0]
+            elif job[1] in self._action_due:
+                self._action_due[job[1]] = 0.0
+
+    def _settle(self, job):
+        # The last queued edit of a forgotten message went out (or failed for good)
+        if job[0] == 'edit':
+            with self._lock:
+                if job[1] not in self._pending:
+                    self._finished.discard(job[1])
+
+    async def _dispatch(self, job, chat_id):
+        try:
+            await self._send(job)
+        except RetryAfter as e:
+            logger.warning(f"Flood limit hit, pausing status updates for {e.retry_after}s")
+            self._paused_until = self.clock() + float(e.retry_after)
+            self._requeue(job)
+        except BadRequest as e:
+            # Telegram rejects edits that do not change the message
+            if 'not modified' not in str(e):
+                logger.error(f"Error sending status update: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error sending status update: {str(e)}")
+        finally:
+            # A requeued edit is still pending, so this keeps its state
+            self._settle(job)
+            self._in_flight.discard(chat_id)
+            self._wakeup.set()
+
+    def _start_ready(self):
+        """Start sending every request allowed right now.
+
+        :rtype: float
+        :returns:
+            Seconds until more requests may be ready, None to wait for a
+            new update or a request in flight.
+        """
+        while True:
+            now = self.clock()
+            delay = self._global_delay(now)
+            if delay > 0:
+                return delay
+            if len(self._in_flight) >= MAX_IN_FLIGHT:
+                return None
+            job, delay = self._next_job(now)
+            if job is None:
+                return delay
+
+            chat_id = job[1][0] if job[0] == 'edit' else job[1]
+            self._recent.append(now)
+            self._chat_ready[chat_id] = now + self._chat_interval(chat_id)
+            self._in_flight.add(chat_id)
+            task = asyncio.ensure_future(self._dispatch(job, chat_id))
+            # Keep a reference so the task is not garbage collected
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        """Send queued edits and chat actions until cancelled."""
+        while True:
+            self._wakeup.clear()
+            delay = self._start_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
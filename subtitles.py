@@ -0,0 +1,121 @@
+"""Fetch video captions and convert them to SRT/VTT.
+
+Captions come from the caption tracks of the player response. They are a
+few KB per video, so parsed cues are cached per (video_id, language).
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_CACHE_SIZE = 512
+
+# (video_id, language) -> list of (start, end, text) cues, least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _find_track(caption_tracks, language, auto, by_prefix):
+    wanted = language.lower()
+    for track in caption_tracks:
+        code = track.code.lower()
+        if code.startswith('a.') != auto:
+            continue
+        if auto:
+            code = code[2:]
+        if code == wanted or (by_prefix and code.split('-')[0] == wanted.split('-')[0]):
+            return track
+    return None
+
+
+def pick_track(caption_tracks, language=None):
+    """Pick the caption track for a language.
+
+    Codes are compared case-insensitively, so Telegram's "pt-br" matches
+    YouTube's "pt-BR", and fall back to the language prefix ("en" matches
+    "en-GB"). Manual captions are preferred over auto-generated ones
+    ("a.<code>"), then English, then whatever comes first.
+    """
+    for code in ([language] if language else []) + ['en']:
+        for auto in (False, True):
+            for by_prefix in (False, True):
+                track = _find_track(caption_tracks, code, auto, by_prefix)
+                if track is not None:
+                    return track
+    return caption_tracks[0] if caption_tracks else None
+
+
+def _fetch_track(track):
+    # json3 has plain millisecond timings, easier to convert than the xml
+    data = track.json_captions
+    cues = []
+    for event in data.get('events', []):
+        text = ''.join(seg.get('utf8', '') for seg in event.get('segs', [])).strip()
+        if not text:
+            continue
+        start = event['tStartMs'] / 1000
+        cues.append((start, start + event.get('dDurationMs', 0) / 1000, text))
+    return cues
+
+
+def get_cues(yt, language=None):
+    """Return the cues of a video, from cache if possible.
+
+    :param yt:
+        The pytube YouTube object.
+    :param str language:
+        Preferred language code, e.g. the Telegram user's language.
+    :rtype: list
+    :returns:
+        (start, end, text) tuples in seconds, empty if there are no captions.
+    """
+    key = (yt.video_id, language)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    track = pick_track(yt.caption_tracks, language)
+    if track is None:
+        return []
+    try:
+        cues = _fetch_track(track)
+    except Exception as e:
+        logger.error(f"Error fetching caption track: {str(e)}")
+        return []
+
+    with _cache_lock:
+        _cache[key] = cues
+        if len(_cache) > TRANSCRIPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return cues
+
+
+def clip_cues(cues, start, end):
+    """Keep the cues inside [start, end] and make them relative to start."""
+    return [(max(cue_start, start) - start, min(cue_end, end) - start, text)
+            for cue_start, cue_end, text in cues
+            if cue_end > start and cue_start < end]
+
+
+def _timestamp(seconds, separator):
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+def to_srt(cues):
+    """Format cues as SubRip."""
+    blocks = [f"{i}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}\n"
+              for i, (start, end, text) in enumerate(cues, start=1)]
+    return '\n'.join(blocks)
+
+
+def to_vtt(cues):
+    """Format cues as WebVTT."""
+    blocks = [f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{text}\n"
+              for start, end, text in cues]
+    return 'WEBVTT\n\n' + '\n'.join(blocks)
@@ -0,0 +1,80 @@
+import struct
+
+import pytest
+
+from clip import ClipRangeError, parse_clip, parse_sidx, parse_timestamp
+
+
+def make_sidx(references, version=0, timescale=1000, earliest=0, first_offset=0):
+    """Build a sidx box from (referenced_size, duration) pairs."""
+    body = bytes([version, 0, 0, 0]) + struct.pack('>II', 1, timescale)
+    if version == 0:
+        body += struct.pack('>II', earliest, first_offset)
+    else:
+        body += struct.pack('>QQ', earliest, first_offset)
+    body += struct.pack('>HH', 0, len(references))
+    for size, duration in references:
+        body += struct.pack('>III', size, duration, 0x90000000)
+    return struct.pack('>I4s', 8 + len(body), b'sidx') + body
+
+
+def test_parse_timestamp():
+    assert parse_timestamp('45') == 45
+    assert parse_timestamp('1:20') == 80
+    assert parse_timestamp('1:02:03') == 3723
+
+
+def test_parse_clip():
+    assert parse_clip('https://youtu.be/x 1:20-1:50') == ('https://youtu.be/x', (80, 110))
+    assert parse_clip('https://youtu.be/x 80-110') == ('https://youtu.be/x', (80, 110))
+    assert parse_clip('https://youtu.be/x 1:02:03-1:02:33') == ('https://youtu.be/x', (3723, 3753))
+
+
+def test_parse_clip_without_window():
+    assert parse_clip('https://youtu.be/x') == ('https://youtu.be/x', None)
+    assert parse_clip(' https://youtu.be/x ') == ('https://youtu.be/x', None)
+    assert parse_clip('https://youtu.be/x please') == ('https://youtu.be/x please', None)
+
+
+@pytest.mark.parametrize('window', ['1:50-1:20', '80-80', '1:99-2:00', '1:00-1:60', '1:2:3:4-5'])
+def test_parse_clip_invalid_window(window):
+    with pytest.raises(ClipRangeError):
+        parse_clip(f'https://youtu.be/x {window}')
+
+
+def test_parse_sidx_v0():
+    box = make_sidx([(1000, 5000), (2000, 5000), (3000, 2500)], first_offset=10)
+    segments = parse_sidx(box, 700)
+    first = 700 + len(box) + 10
+    assert segments == [
+        (0.0, 5.0, first, first + 999),
+        (5.0, 10.0, first + 1000, first + 2999),
+        (10.0, 12.5, first + 3000, first + 5999),
+    ]
+
+
+def test_parse_sidx_v1():
+    box = make_sidx([(100, 90000), (200, 90000)], version=1, timescale=90000, earliest=2 ** 33)
+    segments = parse_sidx(box, 0)
+    start = 2 ** 33 / 90000
+    assert segments == [
+        (start, start + 1, len(box), len(box) + 99),
+        (start + 1, start + 2, len(box) + 100, len(box) + 299),
+    ]
+
+
+def test_parse_sidx_ignores_reference_type_bit():
+    box = make_sidx([(0x80000000 | 500, 1000)])
+    assert parse_sidx(box, 0) == [(0.0, 1.0, len(box), len(box) + 499)]
+
+
+def test_parse_sidx_rejects_other_boxes():
+    box = make_sidx([(100, 1000)])
+    with pytest.raises(ValueError):
+        parse_sidx(box[:4] + b'moof' + box[8:], 0)
+
+
+def test_parse_sidx_truncated():
+    box = make_sidx([(100, 1000), (100, 1000)])
+    with pytest.raises(struct.error):
+        parse_sidx(box[:-6], 0)
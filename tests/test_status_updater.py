@@ -0,0 +1,256 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+
+from telegram.error import BadRequest, RetryAfter
+
+import status_updater
+from status_updater import StatusUpdater
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+        self.errors = []
+        # Cleared to keep requests in flight
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None):
+        await self._request(('edit', chat_id, message_id, text))
+
+    async def send_chat_action(self, chat_id, action):
+        await self._request(('action', chat_id, action))
+
+    async def _request(self, call):
+        self.calls.append(call)
+        await self.gate.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def scenario(test):
+    """Run a test coroutine with a fresh updater, fake bot and fake clock."""
+    def wrapper():
+        async def main():
+            bot = FakeBot()
+            clock = FakeClock()
+            updater = StatusUpdater(bot, asyncio.get_running_loop(), clock)
+            await test(updater, bot, clock)
+        asyncio.run(main())
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@scenario
+async def test_edits_are_coalesced(updater, bot, clock):
+    for percent in (10, 20, 30):
+        updater.edit(1, 5, f"{percent}%")
+    updater._start_ready()
+    await settle()
+
+    assert bot.calls == [('edit', 1, 5, '30%')]
+
+
+@scenario
+async def test_unchanged_edit_is_skipped(updater, bot, clock):
+    updater.edit(1, 5, "Downloading...")
+    updater._start_ready()
+    await settle()
+    clock.now += 5
+    updater.edit(1, 5, "Downloading...")
+    updater._start_ready()
+    await settle()
+
+    assert bot.calls == [('edit', 1, 5, 'Downloading...')]
+
+
+@scenario
+async def test_chat_spacing(updater, bot, clock):
+    updater.edit(1, 5, "first")
+    updater.edit(1, 6, "second")
+    updater.edit(-2, 7, "group")
+
+    updater._start_ready()
+    await settle()
+    assert bot.calls == [('edit', 1, 5, 'first'), ('edit', -2, 7, 'group')]
+    assert updater._start_ready() == pytest.approx(1.0)
+
+    clock.now += 1.0
+    updater.edit(-2, 7, "group again")
+    assert updater._start_ready() == pytest.approx(2.0)
+    await settle()
+    assert bot.calls[2:] == [('edit', 1, 6, 'second')]
+
+
+@scenario
+async def test_global_rate(updater, bot, clock):
+    for chat_id in range(40):
+        updater.edit(chat_id, 1, "Downloading...")
+
+    assert updater._start_ready() == pytest.approx(1.0)
+    await settle()
+    assert len(bot.calls) == status_updater.GLOBAL_RATE
+
+    clock.now += 1.0
+    updater._start_ready()
+    await settle()
+    assert len(bot.calls) == 40
+
+
+@scenario
+async def test_requests_are_sent_concurrently(updater, bot, clock):
+    bot.gate.clear()
+    for chat_id in range(10):
+        updater.edit(chat_id, 1, "Downloading...")
+    updater._start_ready()
+    await settle()
+
+    # All started although none has finished yet
+    assert len(bot.calls) == 10
+
+    # One request per chat at a time, even once the spacing has passed
+    clock.now += 5
+    updater.edit(0, 1, "Merging...")
+    updater._start_ready()
+    await settle()
+    assert len(bot.calls) == 10
+
+    bot.gate.set()
+    await settle()
+    updater._start_ready()
+    await settle()
+    assert bot.calls[-1] == ('edit', 0, 1, 'Merging...')
+
+
+@scenario
+async def test_chat_actions_are_not_starved_by_edits(updater, bot, clock):
+    updater.start_chat_action(1, 'typing', 'job')
+    updater._start_ready()
+    await settle()
+
+    rounds = 0
+    while rounds < 10:
+        clock.now += 1.0
+        # Every round a new progress edit is ready in the same chat
+        updater.edit(1, 5, f"{rounds}%")
+        updater._start_ready()
+        await settle()
+        rounds += 1
+
+    actions = [call for call in bot.calls if call[0] == 'action']
+    # 10 seconds, refreshed every CHAT_ACTION_INTERVAL
+    assert len(actions) == 3
+
+
+@scenario
+async def test_chat_actions_per_job(updater, bot, clock):
+    updater.start_chat_action(1, 'typing', 'download')
+    updater.start_chat_action(1, 'upload_document', 'subtitles')
+    updater._start_ready()
+    await settle()
+    assert bot.calls == [('action', 1, 'upload_document')]
+
+    # The download still runs after the subtitles are sent
+    updater.stop_chat_action(1, 'subtitles')
+    clock.now += status_updater.CHAT_ACTION_INTERVAL
+    updater._start_ready()
+    await settle()
+    assert bot.calls[1:] == [('action', 1, 'typing')]
+
+    updater.stop_chat_action(1, 'download')
+    clock.now += status_updater.CHAT_ACTION_INTERVAL
+    assert updater._start_ready() is None
+    await settle()
+    assert len(bot.calls) == 2
+    assert updater._actions == {} and updater._action_due == {}
+
+
+@scenario
+async def test_retry_after_requeues(updater, bot, clock):
+    bot.errors.append(RetryAfter(5))
+    updater.edit(1, 5, "Downloading...")
+    updater._start_ready()
+    await settle()
+
+    assert updater._start_ready() == pytest.approx(5.0)
+    clock.now += 5
+    updater._start_ready()
+    await settle()
+    assert bot.calls == [('edit', 1, 5, 'Downloading...')] * 2
+
+
+@scenario
+async def test_retry_after_keeps_newer_edit(updater, bot, clock):
+    bot.gate.clear()
+    bot.errors.append(RetryAfter(1))
+    updater.edit(1, 5, "10%")
+    updater._start_ready()
+    await settle()
+    updater.edit(1, 5, "20%")
+    bot.gate.set()
+    await settle()
+
+    clock.now += 1
+    updater._start_ready()
+    await settle()
+    assert bot.calls == [('edit', 1, 5, '10%'), ('edit', 1, 5, '20%')]
+
+
+@scenario
+async def test_not_modified_is_ignored(updater, bot, clock):
+    bot.errors.append(BadRequest("Message is not modified"))
+    updater.edit(1, 5, "Downloading...")
+    updater._start_ready()
+    await settle()
+
+    assert updater._pending == {}
+    assert updater._in_flight == set()
+
+
+@scenario
+async def test_forget_after_final_edit(updater, bot, clock):
+    updater.edit(1, 5, "Downloading...")
+    updater._start_ready()
+    await settle()
+    assert updater._sent == {(1, 5): 'Downloading...'}
+
+    updater.edit(1, 5, "Error: Please try again")
+    updater.forget(1, 5)
+    assert updater._sent == {}
+
+    # The final edit is still delivered, then nothing is kept
+    clock.now += 1
+    updater._start_ready()
+    await settle()
+    assert bot.calls[-1] == ('edit', 1, 5, 'Error: Please try again')
+    assert updater._sent == {} and updater._finished == set() and updater._pending == {}
+
+    clock.now += 1
+    updater._start_ready()
+    assert updater._chat_ready == {}
+
+
+@scenario
+async def test_forget_without_pending_edit(updater, bot, clock):
+    updater.edit(1, 5, "Uploading...")
+    updater._start_ready()
+    await settle()
+    updater.forget(1, 5)
+
+    assert updater._sent == {} and updater._finished == set()
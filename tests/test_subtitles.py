@@ -0,0 +1,117 @@
+import pytest
+
+import subtitles
+
+
+class FakeTrack:
+    def __init__(self, code, events=None):
+        self.code = code
+        self.fetches = 0
+        self._events = events or []
+
+    @property
+    def json_captions(self):
+        self.fetches += 1
+        return {'wireMagic': 'pb3', 'events': self._events}
+
+
+class FakeYouTube:
+    def __init__(self, video_id, caption_tracks):
+        self.video_id = video_id
+        self.caption_tracks = caption_tracks
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    subtitles._cache.clear()
+    yield
+    subtitles._cache.clear()
+
+
+CUES = [(0.5, 2.25, 'Hello'), (3661.0, 3662.5, 'two\nlines')]
+
+
+def test_to_srt():
+    assert subtitles.to_srt(CUES) == (
+        '1\n00:00:00,500 --> 00:00:02,250\nHello\n'
+        '\n'
+        '2\n01:01:01,000 --> 01:01:02,500\ntwo\nlines\n'
+    )
+
+
+def test_to_vtt():
+    assert subtitles.to_vtt(CUES) == (
+        'WEBVTT\n\n'
+        '00:00:00.500 --> 00:00:02.250\nHello\n'
+        '\n'
+        '01:01:01.000 --> 01:01:02.500\ntwo\nlines\n'
+    )
+
+
+def test_empty_cues():
+    assert subtitles.to_srt([]) == ''
+    assert subtitles.to_vtt([]) == 'WEBVTT\n\n'
+
+
+def test_clip_cues():
+    cues = [(0, 5, 'before'), (8, 12, 'start'), (15, 16, 'inside'), (19, 25, 'end'), (30, 31, 'after')]
+    assert subtitles.clip_cues(cues, 10, 20) == [(0, 2, 'start'), (5, 6, 'inside'), (9, 10, 'end')]
+
+
+def test_pick_track():
+    tracks = [FakeTrack('de'), FakeTrack('a.en'), FakeTrack('a.fr'), FakeTrack('fr')]
+    assert subtitles.pick_track(tracks, 'fr').code == 'fr'
+    assert subtitles.pick_track(tracks, 'de').code == 'de'
+    assert subtitles.pick_track(tracks, 'es').code == 'a.en'
+    assert subtitles.pick_track(tracks).code == 'a.en'
+    assert subtitles.pick_track(tracks[2:], 'es').code == 'a.fr'
+    assert subtitles.pick_track([], 'en') is None
+
+
+def test_pick_track_matches_regional_codes():
+    tracks = [FakeTrack('de'), FakeTrack('pt-BR'), FakeTrack('pt-PT'), FakeTrack('a.es'), FakeTrack('en-GB')]
+    # Telegram sends lowercase IETF tags
+    assert subtitles.pick_track(tracks, 'pt-br').code == 'pt-BR'
+    assert subtitles.pick_track(tracks, 'pt-pt').code == 'pt-PT'
+    assert subtitles.pick_track(tracks, 'pt').code == 'pt-BR'
+    assert subtitles.pick_track(tracks, 'DE').code == 'de'
+    assert subtitles.pick_track(tracks, 'de-at').code == 'de'
+    assert subtitles.pick_track(tracks, 'es-mx').code == 'a.es'
+    # English fallback also accepts regional variants
+    assert subtitles.pick_track(tracks, 'ja').code == 'en-GB'
+    assert subtitles.pick_track(tracks).code == 'en-GB'
+
+
+def test_pick_track_prefers_manual_over_auto_generated():
+    tracks = [FakeTrack('a.en'), FakeTrack('en-US')]
+    assert subtitles.pick_track(tracks, 'en').code == 'en-US'
+    assert subtitles.pick_track([FakeTrack('a.en-US'), FakeTrack('a.en')], 'en-us').code == 'a.en-US'
+
+
+def test_get_cues_parses_json3_and_caches():
+    track = FakeTrack('en', [
+        {'tStartMs': 0, 'dDurationMs': 1500, 'segs': [{'utf8': 'Hello '}, {'utf8': 'world'}]},
+        {'tStartMs': 1500, 'dDurationMs': 10, 'segs': [{'utf8': '\n'}]},
+        {'tStartMs': 2000},
+        {'tStartMs': 2500, 'dDurationMs': 500, 'segs': [{'utf8': 'Bye'}]},
+    ])
+    yt = FakeYouTube('abc', [track])
+
+    assert subtitles.get_cues(yt, 'en') == [(0.0, 1.5, 'Hello world'), (2.5, 3.0, 'Bye')]
+    assert subtitles.get_cues(yt, 'en') == [(0.0, 1.5, 'Hello world'), (2.5, 3.0, 'Bye')]
+    assert track.fetches == 1
+
+
+def test_get_cues_without_tracks():
+    assert subtitles.get_cues(FakeYouTube('abc', []), 'en') == []
+
+
+def test_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(subtitles, 'TRANSCRIPT_CACHE_SIZE', 2)
+    first = FakeYouTube('first', [FakeTrack('en')])
+    subtitles.get_cues(first)
+    subtitles.get_cues(FakeYouTube('second', [FakeTrack('en')]))
+    subtitles.get_cues(first)
+    subtitles.get_cues(FakeYouTube('third', [FakeTrack('en')]))
+
+    assert list(subtitles._cache) == [('first', None), ('third', None)]